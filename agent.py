@@ -8,13 +8,39 @@ Book Content RAG Agent
 """
 
 import os
+import json
+import functools
+import asyncio
+import hashlib
 import logging
-from typing import List, Dict, Any
+from dataclasses import dataclass
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
 from dotenv import load_dotenv
 
+import httpx
+import numpy as np
+
 # External libs (only used if configured)
 import cohere
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import (
+    QuantizationSearchParams,
+    QueryRequest,
+    ScoredPoint,
+    SearchParams,
+)
+
+from query_cache import QueryCache
+
+try:
+    import ahocorasick
+except ImportError:  # pure-Python keyword scan fallback
+    ahocorasick = None
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # character-based truncation fallback
+    Tokenizer = None
 
 # --------------------------------------------------
 # ENV & LOGGING
@@ -26,182 +52,589 @@ logger = logging.getLogger("book-rag")
 
 QDRANT_URL = os.getenv("QDRANT_URL")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
-QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION_NAME", "book_embeddings")
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION_NAME", "book_embeddings")  # FP32 vectors, cosine distance
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", 6334))
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 
+EMBED_DIM = 1024  # embed-english-v3.0
+EMBED_BATCH_SIZE = 96  # max texts per Cohere embed call
+BATCH_CHAT_CONCURRENCY = 8  # in-flight chat calls per /query_batch request
+SEMANTIC_CACHE_SIZE = 512
+SEMANTIC_CACHE_THRESHOLD = 0.93
+
+SEARCH_LIMIT = 5
+
+# Total excerpt tokens sent to the chat model, split across retained chunks
+PROMPT_TOKEN_BUDGET = 1000
+CHARS_PER_TOKEN = 4  # rough estimate when no tokenizer is available
+# int8 HNSW traversal, then rescore the 2x oversampled candidates on originals
+SEARCH_PARAMS = SearchParams(
+    hnsw_ef=64,
+    quantization=QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+
+GREETINGS = frozenset({"hello", "hi", "hey", "good morning", "good evening", "good afternoon"})
+
+OFF_TOPIC_KEYWORDS = frozenset({
+    "weather", "joke", "news", "sports", "movie", "celebrity",
+    "crypto", "recipe", "food", "travel", "music", "song",
+    "health", "medical", "exercise", "diet"
+})
+
 if not COHERE_API_KEY:
     logger.warning("COHERE_API_KEY is missing — agent will run in fallback mode")
 
 if not QDRANT_URL:
     logger.warning("QDRANT_URL not set — using local Qdrant or disabling vector search")
 
+# --------------------------------------------------
+# SHARED CLIENTS (one connection pool per process)
+# --------------------------------------------------
+def _create_cohere_client() -> Tuple[Optional[cohere.AsyncClient], Optional[httpx.AsyncClient]]:
+    """Cohere client plus the pooled HTTP/2 transport it uses (closed on shutdown)"""
+    if not COHERE_API_KEY:
+        return None, None
+
+    http_client = None
+    try:
+        logger.info("Initializing Cohere client...")
+        http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50),
+            timeout=30
+        )
+        client = cohere.AsyncClient(COHERE_API_KEY, httpx_client=http_client)
+        logger.info("Cohere client initialized")
+        return client, http_client
+    except Exception:
+        logger.exception("Failed to initialize Cohere client")
+        return None, http_client
+
+
+def _create_qdrant_client() -> Optional[AsyncQdrantClient]:
+    try:
+        logger.info("Initializing Qdrant client...")
+        # gRPC: binary framing multiplexed over one long-lived HTTP/2 channel
+        if QDRANT_URL:
+            client = AsyncQdrantClient(
+                url=QDRANT_URL,
+                api_key=QDRANT_API_KEY,
+                prefer_grpc=True,
+                grpc_port=QDRANT_GRPC_PORT,
+                timeout=30
+            )
+        else:
+            client = AsyncQdrantClient(
+                host=os.getenv("QDRANT_HOST", "localhost"),
+                port=int(os.getenv("QDRANT_PORT", 6333)),
+                prefer_grpc=True,
+                grpc_port=QDRANT_GRPC_PORT
+            )
+        logger.info("Qdrant client initialized")
+        return client
+
+    except Exception:
+        logger.exception("Failed to initialize Qdrant")
+        return None
+
+
+cohere_client, cohere_http_client = _create_cohere_client()
+qdrant = _create_qdrant_client()
+
+# --------------------------------------------------
+# INPUT CLASSIFICATION
+# --------------------------------------------------
+def _build_keyword_automaton():
+    """Single automaton over greetings + off-topic keywords (value = category)"""
+    if ahocorasick is None:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for word in OFF_TOPIC_KEYWORDS:
+        automaton.add_word(word, "off_topic")
+    for word in GREETINGS:
+        automaton.add_word(word, "greeting")
+    automaton.make_automaton()
+    return automaton
+
+
+KEYWORD_AUTOMATON = _build_keyword_automaton()
+
+
+def classify_input(normalized: str) -> Optional[str]:
+    """Return "greeting", "off_topic" or None for stripped, lowercased input"""
+    if KEYWORD_AUTOMATON is None:
+        if normalized in GREETINGS:
+            return "greeting"
+        if any(k in normalized for k in OFF_TOPIC_KEYWORDS):
+            return "off_topic"
+        return None
+
+    # Greetings must match the whole input; off-topic keywords match anywhere
+    if KEYWORD_AUTOMATON.get(normalized, None) == "greeting":
+        return "greeting"
+    for _, category in KEYWORD_AUTOMATON.iter(normalized):
+        if category == "off_topic":
+            return "off_topic"
+    return None
+
+
+# --------------------------------------------------
+# PROMPT & CANNED RESPONSES
+# --------------------------------------------------
+_RAG_TEMPLATE = """
+You are a helpful assistant that answers questions ONLY using the provided book excerpts below.
+
+BOOK EXCERPTS:
+{context}
+
+USER QUESTION:
+{user_input}
+
+INSTRUCTIONS:
+- Answer ONLY using information from the book excerpts.
+- Do NOT use outside knowledge.
+- Be concise and accurate.
+
+ANSWER:
+"""
+
+_EXCERPT_SEPARATOR = "\n\n---\n\n"
+
+EMPTY_QUERY_RESPONSE = "Query cannot be empty."
+
+GREETING_RESPONSE = (
+    "Hello! I'm your Book Assistant. "
+    "Ask me anything about ROS 2, humanoid robotics, or the course material."
+)
+
+OFF_TOPIC_RESPONSE = (
+    "I can only answer questions related to the book content. "
+    "Please ask about robotics, ROS 2, or the course material."
+)
+
+NOT_CONFIGURED_RESPONSE = (
+    "⚠️ AI services are not configured.\n\n"
+    "Please set COHERE_API_KEY to enable question answering."
+)
+
+NO_CONTENT_RESPONSE = (
+    "No relevant book content found. "
+    "Try asking about ROS 2 or humanoid robotics."
+)
+
+NO_ANSWER_RESPONSE = "No response generated. Please rephrase your question."
+
+ERROR_RESPONSE = "Sorry, I encountered an internal error while processing your request."
+
+
+# --------------------------------------------------
+# TOKEN-AWARE TRUNCATION
+# --------------------------------------------------
+@functools.lru_cache(maxsize=1)
+def get_tokenizer():
+    """Load the tokenizer on first use.
+
+    TOKENIZER_PATH points at a local tokenizer.json; TOKENIZER_NAME opts in to
+    downloading one from Hugging Face. With neither, truncate by characters.
+    """
+    if Tokenizer is None:
+        return None
+
+    path = os.getenv("TOKENIZER_PATH")
+    name = os.getenv("TOKENIZER_NAME")
+    try:
+        if path:
+            return Tokenizer.from_file(path)
+        if name:
+            return Tokenizer.from_pretrained(name)
+    except Exception:
+        logger.warning("Could not load tokenizer %s — truncating by characters", path or name)
+    return None
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Crop text to at most `budget` tokens"""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return text[:budget * CHARS_PER_TOKEN]
+
+    ids = tokenizer.encode(text, add_special_tokens=False).ids
+    if len(ids) <= budget:
+        return text
+    return tokenizer.decode(ids[:budget])
+
+
+def _sse_event(delta: str) -> str:
+    """Format a text delta as a server-sent event"""
+    return f"data: {json.dumps({'delta': delta})}\n\n"
+
+
+@dataclass(slots=True)
+class Hit:
+    """A retrieved book excerpt and its similarity score"""
+    content: str
+    score: float
+
+
 # --------------------------------------------------
 # BOOK CONTENT AGENT
 # --------------------------------------------------
 class BookContentAgent:
+    __slots__ = (
+        "cohere_client", "qdrant", "_http_client", "_embed_cache",
+        "_sem_vecs", "_sem_answers", "_sem_count", "_sem_next"
+    )
+
     def __init__(self):
-        self.cohere_client = None
-        self.qdrant = None
+        # Clients are process-wide singletons; the agent only holds references
+        self.cohere_client = cohere_client
+        self.qdrant = qdrant
+        self._http_client = cohere_http_client
+        self._embed_cache = QueryCache(max_size=2000, ttl_seconds=600)
+
+        # Semantic answer cache: ring buffer of L2-normalized query vectors
+        # (rows) -> answers; only the first _sem_count rows are valid
+        self._sem_vecs = np.zeros((SEMANTIC_CACHE_SIZE, EMBED_DIM), dtype=np.float32)
+        self._sem_answers: List[Optional[str]] = [None] * SEMANTIC_CACHE_SIZE
+        self._sem_count = 0
+        self._sem_next = 0
 
         logger.info("BookContentAgent initialized")
-        self._initialize_clients()
-
-    def _initialize_clients(self):
-        """Initialize external services only if config exists"""
-
-        # Cohere
-        if COHERE_API_KEY and self.cohere_client is None:
-            try:
-                logger.info("Initializing Cohere client...")
-                self.cohere_client = cohere.Client(COHERE_API_KEY)
-                logger.info("Cohere client initialized")
-            except Exception:
-                logger.exception("Failed to initialize Cohere client")
-                self.cohere_client = None
-
-        # Qdrant
+
+    async def connect(self):
+        """Probe Qdrant once at application startup; raises so the worker fails fast"""
         if self.qdrant is None:
-            try:
-                logger.info("Initializing Qdrant client...")
-                if QDRANT_URL:
-                    self.qdrant = QdrantClient(
-                        url=QDRANT_URL,
-                        api_key=QDRANT_API_KEY,
-                        timeout=30
-                    )
-                else:
-                    self.qdrant = QdrantClient(
-                        host=os.getenv("QDRANT_HOST", "localhost"),
-                        port=int(os.getenv("QDRANT_PORT", 6333))
-                    )
-
-                self.qdrant.get_collections()
-                logger.info(f"Connected to Qdrant collection: {QDRANT_COLLECTION}")
-
-            except Exception:
-                logger.exception("Failed to initialize Qdrant")
-                self.qdrant = None
+            return
+
+        try:
+            await self.qdrant.get_collections()
+            logger.info("Connected to Qdrant collection: %s", QDRANT_COLLECTION)
+        except Exception:
+            logger.exception("Failed to connect to Qdrant")
+            raise
+
+    async def close(self):
+        if self.qdrant is not None:
+            await self.qdrant.close()
+        if self._http_client is not None:
+            await self._http_client.aclose()
+
+    async def _search(self, vectors: List[np.ndarray]) -> List[List[ScoredPoint]]:
+        """Search several FP32 query vectors in a single query_batch_points RPC"""
+        # Over gRPC the values are sent as packed float32, not JSON numbers
+        responses = await self.qdrant.query_batch_points(
+            collection_name=QDRANT_COLLECTION,
+            requests=[
+                QueryRequest(
+                    query=vector.tolist(),
+                    limit=SEARCH_LIMIT,
+                    with_payload=True,
+                    params=SEARCH_PARAMS
+                )
+                for vector in vectors
+            ]
+        )
+        return [response.points for response in responses]
 
     # --------------------------------------------------
-    # QUERY
+    # EMBEDDING
     # --------------------------------------------------
-    def query(self, user_input: str) -> str:
-        if not user_input or not user_input.strip():
-            return "Query cannot be empty."
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, fanning out batches of EMBED_BATCH_SIZE concurrently"""
+        batches = [
+            texts[i:i + EMBED_BATCH_SIZE]
+            for i in range(0, len(texts), EMBED_BATCH_SIZE)
+        ]
 
-        # Greeting shortcut
-        greetings = {"hello", "hi", "hey", "good morning", "good evening", "good afternoon"}
-        if user_input.lower().strip() in greetings:
-            return (
-                "Hello! I'm your Book Assistant. "
-                "Ask me anything about ROS 2, humanoid robotics, or the course material."
+        responses = await asyncio.gather(*[
+            self.cohere_client.embed(
+                texts=batch,
+                model="embed-english-v3.0",
+                input_type="search_query"
             )
+            for batch in batches
+        ])
 
-        # Off-topic guard
-        off_topic_keywords = [
-            "weather", "joke", "news", "sports", "movie", "celebrity",
-            "crypto", "recipe", "food", "travel", "music", "song",
-            "health", "medical", "exercise", "diet"
-        ]
+        return [vector for response in responses for vector in response.embeddings]
 
-        if any(k in user_input.lower() for k in off_topic_keywords):
-            return (
-                "I can only answer questions related to the book content. "
-                "Please ask about robotics, ROS 2, or the course material."
-            )
+    # --------------------------------------------------
+    # SEMANTIC CACHE
+    # --------------------------------------------------
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        qv = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(qv)
+        return qv / norm if norm else qv
+
+    def _semantic_lookup(self, qv_normed: np.ndarray) -> Optional[str]:
+        """Return a cached answer for a near-duplicate question, if any"""
+        if not self._sem_count or qv_normed.shape[0] != EMBED_DIM:
+            return None
+
+        # Stored rows are pre-normalized, so the dot product is the cosine
+        sims = self._sem_vecs[:self._sem_count] @ qv_normed
+        idx = int(sims.argmax())
+        if sims[idx] >= SEMANTIC_CACHE_THRESHOLD:
+            logger.debug("Semantic cache hit (similarity=%.3f)", sims[idx])
+            return self._sem_answers[idx]
+        return None
+
+    def _semantic_store(self, qv_normed: np.ndarray, answer: str):
+        if qv_normed.shape[0] != EMBED_DIM:
+            return
+
+        # Overwrite the oldest row once full (FIFO eviction, no reallocation)
+        self._sem_vecs[self._sem_next] = qv_normed
+        self._sem_answers[self._sem_next] = answer
+        self._sem_next = (self._sem_next + 1) % SEMANTIC_CACHE_SIZE
+        self._sem_count = min(self._sem_count + 1, SEMANTIC_CACHE_SIZE)
+
+    # --------------------------------------------------
+    # INPUT GUARD
+    # --------------------------------------------------
+    def _guard(self, normalized: str) -> Optional[str]:
+        """Canned answer for inputs that never reach retrieval, else None"""
+        if not normalized:
+            return EMPTY_QUERY_RESPONSE
+
+        category = classify_input(normalized)
+
+        # Greeting shortcut
+        if category == "greeting":
+            return GREETING_RESPONSE
+
+        # Off-topic guard
+        if category == "off_topic":
+            return OFF_TOPIC_RESPONSE
 
         # Hard stop if AI not configured
         if not self.cohere_client:
-            return (
-                "⚠️ AI services are not configured.\n\n"
-                "Please set COHERE_API_KEY to enable question answering."
-            )
+            return NOT_CONFIGURED_RESPONSE
+
+        return None
+
+    # --------------------------------------------------
+    # RETRIEVAL + PROMPT
+    # --------------------------------------------------
+    def _build_prompt(self, user_input: str, hits: List[ScoredPoint]) -> Optional[str]:
+        """RAG prompt from search hits, or None if nothing relevant was found"""
+        retrieved_content: List[Hit] = []
+
+        for hit in hits:
+            score = float(hit.score or 0.0)
+            if score >= 0.3:
+                text = (hit.payload or {}).get("content", "")
+                if text.strip():
+                    retrieved_content.append(Hit(content=text, score=score))
+
+        logger.debug("Retrieved %d chunks", len(retrieved_content))
+
+        if not retrieved_content:
+            return None
+
+        budget_per_chunk = PROMPT_TOKEN_BUDGET // len(retrieved_content)
+        for item in retrieved_content:
+            item.content = truncate_to_tokens(item.content, budget_per_chunk)
+
+        parts: List[str] = []
+        for i, item in enumerate(retrieved_content):
+            if i:
+                parts.append(_EXCERPT_SEPARATOR)
+            parts.append(f"[Excerpt {i+1}]:\n")
+            parts.append(item.content)
+
+        return _RAG_TEMPLATE.format_map(
+            {"context": "".join(parts), "user_input": user_input}
+        )
+
+    async def _prepare_many(
+        self, user_inputs: List[str]
+    ) -> List[Tuple[Optional[str], Optional[str], Optional[np.ndarray]]]:
+        """Run everything up to generation for several inputs at once.
+
+        One embed call for all cache misses and one batched query RPC for all
+        semantic-cache misses. Inputs are expected to be distinct (query_many
+        dedupes them). Each result is (answer, None, None) when no LLM
+        call is needed, otherwise (None, rag_prompt, normalized query vector).
+        """
+        results: List[Any] = [None] * len(user_inputs)
+        normalized = [u.strip().lower() if u else "" for u in user_inputs]
+
+        pending: List[int] = []
+        for i, text in enumerate(normalized):
+            canned = self._guard(text)
+            if canned is not None:
+                results[i] = (canned, None, None)
+            else:
+                pending.append(i)
+
+        if not pending:
+            return results
+
+        # --------------------------------------------------
+        # EMBEDDING
+        # --------------------------------------------------
+        cache_keys = {
+            i: hashlib.blake2b(normalized[i].encode(), digest_size=16).hexdigest()
+            for i in pending
+        }
+
+        # Query vectors are kept as FP32 (the collection's storage type)
+        # rather than the float64 lists the Cohere SDK returns
+        vectors: Dict[int, np.ndarray] = {}
+        misses: List[int] = []
+        for i in pending:
+            vector = self._embed_cache.get(cache_keys[i])
+            if vector is None:
+                misses.append(i)
+            else:
+                vectors[i] = vector
+
+        if misses:
+            embeddings = await self._embed([user_inputs[i] for i in misses])
+
+            for i, vector in zip(misses, embeddings):
+                vectors[i] = np.asarray(vector, dtype=np.float32)
+                self._embed_cache.put(cache_keys[i], vectors[i])
+
+        qv_normed: Dict[int, np.ndarray] = {}
+        to_search: List[int] = []
+        for i in pending:
+            qv_normed[i] = self._normalize(vectors[i])
+            cached_answer = self._semantic_lookup(qv_normed[i])
+            if cached_answer is not None:
+                results[i] = (cached_answer, None, None)
+            else:
+                to_search.append(i)
+
+        # --------------------------------------------------
+        # VECTOR SEARCH
+        # --------------------------------------------------
+        hits_per_query: List[List[ScoredPoint]] = [[] for _ in to_search]
+        if self.qdrant and to_search:
+            hits_per_query = await self._search([vectors[i] for i in to_search])
+
+        for i, hits in zip(to_search, hits_per_query):
+            rag_prompt = self._build_prompt(user_inputs[i], hits)
+            if rag_prompt is None:
+                results[i] = (NO_CONTENT_RESPONSE, None, None)
+            else:
+                results[i] = (None, rag_prompt, qv_normed[i])
+
+        return results
+
+    async def _prepare(
+        self, user_input: str
+    ) -> Tuple[Optional[str], Optional[str], Optional[np.ndarray]]:
+        return (await self._prepare_many([user_input]))[0]
+
+    # --------------------------------------------------
+    # GENERATION
+    # --------------------------------------------------
+    async def _generate(self, rag_prompt: str, qv_normed: np.ndarray) -> str:
+        response = await self.cohere_client.chat(
+            model="command-a-03-2025",
+            message=rag_prompt,
+            temperature=0.2,
+            max_tokens=500
+        )
+
+        answer = response.text.strip() if response.text else ""
+        if not answer:
+            return NO_ANSWER_RESPONSE
 
+        self._semantic_store(qv_normed, answer)
+        return answer
+
+    # --------------------------------------------------
+    # QUERY
+    # --------------------------------------------------
+    async def query(self, user_input: str) -> str:
         try:
-            # --------------------------------------------------
-            # EMBEDDING
-            # --------------------------------------------------
-            embed_response = self.cohere_client.embed(
-                texts=[user_input],
-                model="embed-english-v3.0",
-                input_type="search_query"
-            )
+            answer, rag_prompt, qv_normed = await self._prepare(user_input)
+            if answer is not None:
+                return answer
 
-            query_vector = embed_response.embeddings[0]
+            return await self._generate(rag_prompt, qv_normed)
 
-            # --------------------------------------------------
-            # VECTOR SEARCH
-            # --------------------------------------------------
-            retrieved_content: List[Dict[str, Any]] = []
+        except Exception:
+            logger.exception("RAG query failed")
+            return ERROR_RESPONSE
 
-            if self.qdrant:
-                hits = self.qdrant.search(
-                    collection_name=QDRANT_COLLECTION,
-                    query_vector=query_vector,
-                    limit=5,
-                    with_payload=True
-                )
+    async def query_many(self, user_inputs: List[str]) -> List[str]:
+        """Answer several questions with one embed call and one search RPC"""
+        # Answer each distinct question once, then fan the answers back out
+        normalized = [u.strip().lower() if u else "" for u in user_inputs]
+        distinct: Dict[str, str] = {}
+        for text, user_input in zip(normalized, user_inputs):
+            distinct.setdefault(text, user_input)
 
-                for hit in hits:
-                    score = float(hit.score or 0.0)
-                    if score >= 0.3:
-                        text = (hit.payload or {}).get("content", "")
-                        if text.strip():
-                            retrieved_content.append(
-                                {"content": text[:800], "score": score}
-                            )
-
-            logger.info(f"Retrieved {len(retrieved_content)} chunks")
-
-            if not retrieved_content:
-                return (
-                    "No relevant book content found. "
-                    "Try asking about ROS 2 or humanoid robotics."
-                )
+        try:
+            prepared = await self._prepare_many(list(distinct.values()))
+        except Exception:
+            logger.exception("RAG batch query failed")
+            return [ERROR_RESPONSE] * len(user_inputs)
 
-            # --------------------------------------------------
-            # RAG PROMPT
-            # --------------------------------------------------
-            context = "\n\n---\n\n".join(
-                f"[Excerpt {i+1}]:\n{item['content']}"
-                for i, item in enumerate(retrieved_content)
-            )
+        # Bound concurrent chat calls so one batch can't trip Cohere's rate limit
+        semaphore = asyncio.Semaphore(BATCH_CHAT_CONCURRENCY)
 
-            rag_prompt = f"""
-You are a helpful assistant that answers questions ONLY using the provided book excerpts below.
+        async def answer_one(answer, rag_prompt, qv_normed) -> str:
+            if answer is not None:
+                return answer
+            async with semaphore:
+                return await self._generate(rag_prompt, qv_normed)
 
-BOOK EXCERPTS:
-{context}
+        answers = await asyncio.gather(
+            *[answer_one(*item) for item in prepared],
+            return_exceptions=True
+        )
 
-USER QUESTION:
-{user_input}
+        by_text: Dict[str, str] = {}
+        for text, answer in zip(distinct, answers):
+            if isinstance(answer, Exception):
+                logger.error("RAG batch generation failed", exc_info=answer)
+                answer = ERROR_RESPONSE
+            by_text[text] = answer
 
-INSTRUCTIONS:
-- Answer ONLY using information from the book excerpts.
-- Do NOT use outside knowledge.
-- Be concise and accurate.
+        return [by_text[text] for text in normalized]
 
-ANSWER:
-"""
+    # --------------------------------------------------
+    # STREAMING QUERY
+    # --------------------------------------------------
+    async def stream(self, user_input: str) -> AsyncIterator[str]:
+        """Same as query(), but yields server-sent events as tokens arrive"""
+        try:
+            answer, rag_prompt, qv_normed = await self._prepare(user_input)
+            if answer is not None:
+                yield _sse_event(answer)
+                return
 
-            # --------------------------------------------------
-            # GENERATION
-            # --------------------------------------------------
-            response = self.cohere_client.chat(
+            parts: List[str] = []
+            async for event in self.cohere_client.chat_stream(
                 model="command-a-03-2025",
                 message=rag_prompt,
                 temperature=0.2,
                 max_tokens=500
-            )
+            ):
+                if event.event_type == "text-generation":
+                    parts.append(event.text)
+                    yield _sse_event(event.text)
+
+            answer = "".join(parts).strip()
+            if not answer:
+                yield _sse_event(NO_ANSWER_RESPONSE)
+                return
 
-            answer = response.text.strip() if response.text else ""
-            return answer or "No response generated. Please rephrase your question."
+            self._semantic_store(qv_normed, answer)
 
         except Exception:
-            logger.exception("RAG query failed")
-            return (
-                "Sorry, I encountered an internal error while processing your request."
-            )
+            logger.exception("RAG stream failed")
+            yield _sse_event(ERROR_RESPONSE)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Embedding cache hit/miss counters"""
+        return self._embed_cache.stats()
 
     def reset(self):
         """Reset agent state if needed"""
@@ -212,5 +645,10 @@ ANSWER:
 # LOCAL TEST
 # --------------------------------------------------
 if __name__ == "__main__":
-    agent = BookContentAgent()
-    print(agent.query("What is ROS 2?"))
+    async def main():
+        agent = BookContentAgent()
+        await agent.connect()
+        print(await agent.query("What is ROS 2?"))
+        await agent.close()
+
+    asyncio.run(main())
@@ -3,53 +3,76 @@ backend/api.py - FastAPI RAG Agent API
 """
 
 import os
-import traceback
+import asyncio
+import functools
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 
 from dotenv import load_dotenv
 import logging
 
-# ────────────────────────────────────────────────
-# Debug prints at module level (runs on cold start / import)
-# ────────────────────────────────────────────────
-print("=== backend/api.py MODULE STARTED LOADING ===")
-print(f"Current working directory: {os.getcwd()}")
-
 # Load environment variables
 load_dotenv()
-print("Environment variables loaded via dotenv")
 
-# Env var visibility (safe, no secrets leaked)
-print(f"QDRANT_URL exists: {'QDRANT_URL' in os.environ}")
-print(f"QDRANT_API_KEY exists: {'QDRANT_API_KEY' in os.environ}")
-print(f"COHERE_API_KEY exists: {'COHERE_API_KEY' in os.environ}")
-print(f"OPENROUTER_API_KEY exists: {'OPENROUTER_API_KEY' in os.environ}")
-
-# Logging setup
+# Logging setup (LOG_LEVEL=DEBUG for per-request detail)
 logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger("api")
-logger.info("Logging initialized")
+
+# Env var visibility (safe, no secrets leaked)
+logger.info(
+    "Startup: cwd=%s QDRANT_URL=%s QDRANT_API_KEY=%s COHERE_API_KEY=%s OPENROUTER_API_KEY=%s",
+    os.getcwd(),
+    "QDRANT_URL" in os.environ,
+    "QDRANT_API_KEY" in os.environ,
+    "COHERE_API_KEY" in os.environ,
+    "OPENROUTER_API_KEY" in os.environ,
+)
 
 # ────────────────────────────────────────────────
 # Import Agent (FIXED: absolute import)
 # ────────────────────────────────────────────────
 try:
-    from agent import BookContentAgent
-    print("Successfully imported BookContentAgent")
-except Exception as import_err:
-    print(f"CRITICAL: Failed to import BookContentAgent: {import_err}")
-    traceback.print_exc()
+    from agent import (
+        BookContentAgent,
+        classify_input,
+        EMBED_BATCH_SIZE,
+        get_tokenizer,
+        GREETING_RESPONSE,
+        OFF_TOPIC_RESPONSE,
+    )
+except Exception:
+    logger.critical("Failed to import BookContentAgent", exc_info=True)
     raise
 
 # ────────────────────────────────────────────────
 # FastAPI App
 # ────────────────────────────────────────────────
-app = FastAPI(title="RAG Agent API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the shared agent and probe Qdrant once at boot, not on first request;
+    # a failed probe aborts startup instead of serving without vector search
+    agent = get_shared_agent()
+    try:
+        await agent.connect()
+        # Load (possibly download) the tokenizer off the event loop, before any
+        # request needs it; later get_tokenizer() calls hit the lru_cache
+        await asyncio.to_thread(get_tokenizer)
+        yield
+    finally:
+        await agent.close()
+
+app = FastAPI(
+    title="RAG Agent API",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
+)
 
 # CORS (open for dev / hackathon)
 app.add_middleware(
@@ -60,6 +83,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Response compression (Brotli when available, gzip otherwise)
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=500)
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=500)
+
 # ────────────────────────────────────────────────
 # Pydantic Models
 # ────────────────────────────────────────────────
@@ -75,26 +105,52 @@ class QueryResponse(BaseModel):
     timestamp: str
     status: str
 
+class BatchQueryRequest(BaseModel):
+    queries: List[str] = Field(min_length=1, max_length=EMBED_BATCH_SIZE)
+    session_id: Optional[str] = None
+
+class BatchQueryResponse(BaseModel):
+    responses: List[str]
+    session_id: Optional[str] = None
+    timestamp: str
+    status: str
+
 # ────────────────────────────────────────────────
-# Agent Manager
+# Input Guard (runs before any agent work)
 # ────────────────────────────────────────────────
-class AgentManager:
-    def __init__(self):
-        self.agents: Dict[str, BookContentAgent] = {}
-        print("AgentManager initialized")
-
-    def get_agent(self, session_id: Optional[str] = None) -> BookContentAgent:
-        key = session_id or "default"
+CANNED_RESPONSES = {
+    "greeting": GREETING_RESPONSE,
+    "off_topic": OFF_TOPIC_RESPONSE,
+}
+
+async def canned_response(request: QueryRequest) -> Optional[ORJSONResponse]:
+    """Answer empty / greeting / off-topic queries without dispatching to the agent"""
+    normalized = request.query.strip().lower()
+    if not normalized:
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
 
-        if key not in self.agents:
-            print(f"Creating new agent for session: {key}")
-            self.agents[key] = BookContentAgent()
-        else:
-            print(f"Reusing existing agent for session: {key}")
+    category = classify_input(normalized)
+    if category is None:
+        return None
 
-        return self.agents[key]
+    return ORJSONResponse(
+        QueryResponse(
+            response=CANNED_RESPONSES[category],
+            sources=[],
+            session_id=request.session_id,
+            timestamp=datetime.utcnow().isoformat(),
+            status="success"
+        ).model_dump()
+    )
 
-agent_manager = AgentManager()
+# ────────────────────────────────────────────────
+# Shared Agent
+# ────────────────────────────────────────────────
+@functools.lru_cache(maxsize=1)
+def get_shared_agent() -> BookContentAgent:
+    """BookContentAgent holds no per-session state, so all sessions share one
+    instance (and its Cohere / Qdrant connection pools)"""
+    return BookContentAgent()
 
 # ────────────────────────────────────────────────
 # Routes
@@ -111,14 +167,22 @@ async def health():
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@app.get("/cache_stats")
+async def cache_stats():
+    agent = get_shared_agent()
+    return agent.cache_stats()
+
 @app.post("/query", response_model=QueryResponse)
-async def query_endpoint(request: QueryRequest):
-    if not request.query.strip():
-        raise HTTPException(status_code=400, detail="Query cannot be empty")
+async def query_endpoint(
+    request: QueryRequest,
+    canned: Optional[ORJSONResponse] = Depends(canned_response)
+):
+    if canned is not None:
+        return canned
 
     try:
-        agent = agent_manager.get_agent(request.session_id)
-        response_text = agent.query(request.query)
+        agent = get_shared_agent()
+        response_text = await agent.query(request.query)
 
         return QueryResponse(
             response=response_text,
@@ -128,10 +192,34 @@ async def query_endpoint(request: QueryRequest):
             status="success"
         )
 
-    except Exception as e:
-        print("ERROR in /query")
-        traceback.print_exc()
+    except Exception:
         logger.error("Query failed", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
 
-print("=== backend/api.py LOADED SUCCESSFULLY ===")
+@app.post("/query_batch", response_model=BatchQueryResponse)
+async def query_batch_endpoint(request: BatchQueryRequest):
+    try:
+        agent = get_shared_agent()
+        responses = await agent.query_many(request.queries)
+
+        return BatchQueryResponse(
+            responses=responses,
+            session_id=request.session_id,
+            timestamp=datetime.utcnow().isoformat(),
+            status="success"
+        )
+
+    except Exception:
+        logger.error("Batch query failed", exc_info=True)
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.post("/query_stream")
+async def query_stream_endpoint(request: QueryRequest):
+    if not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+
+    agent = get_shared_agent()
+    return StreamingResponse(
+        agent.stream(request.query),
+        media_type="text/event-stream"
+    )
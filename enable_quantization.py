@@ -0,0 +1,58 @@
+"""
+enable_quantization.py
+One-time migration: int8 scalar quantization for the book embeddings collection
+(quantized vectors kept in RAM, FP32 originals moved on disk for rescoring)
+"""
+
+import argparse
+import asyncio
+
+from qdrant_client.models import (
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    VectorParamsDiff,
+)
+
+from agent import QDRANT_COLLECTION, qdrant
+
+
+async def enable_quantization(force: bool):
+    if qdrant is None:
+        raise SystemExit("Qdrant client is not configured")
+
+    try:
+        info = await qdrant.get_collection(QDRANT_COLLECTION)
+        if info.config.quantization_config is not None and not force:
+            print(f"Quantization already configured on {QDRANT_COLLECTION}: "
+                  f"{info.config.quantization_config}")
+            return
+
+        print(f"Enabling int8 scalar quantization on {QDRANT_COLLECTION}...")
+        await qdrant.update_collection(
+            collection_name=QDRANT_COLLECTION,
+            vectors_config={"": VectorParamsDiff(on_disk=True)},
+            quantization_config=ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=True)
+            )
+        )
+        print("Done")
+    finally:
+        await qdrant.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Enable int8 scalar quantization on the Qdrant collection"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-apply even if the collection already has quantization configured"
+    )
+
+    args = parser.parse_args()
+    asyncio.run(enable_quantization(args.force))
+
+if __name__ == "__main__":
+    main()
@@ -29,12 +29,18 @@ def main():
         action="store_true",
         help="Enable auto-reload on code changes"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 2)),
+        help="Number of worker processes (default: $WEB_CONCURRENCY or CPU count)"
+    )
 
     args = parser.parse_args()
     host = args.host
     port = args.port
 
-    print(f"Starting RAG Agent API server on {host}:{port}")
+    print(f"Starting RAG Agent API server on {host}:{port} ({args.workers} workers)")
     print("Press Ctrl+C to stop the server")
 
     # Import the FastAPI app from api.py
@@ -46,6 +52,12 @@ def main():
         host=host,
         port=port,
         reload=args.reload,
+        # uvicorn ignores workers when reload is enabled
+        workers=1 if args.reload else args.workers,
+        loop="uvloop",
+        http="httptools",
+        limit_concurrency=1000,
+        timeout_keep_alive=30,
         log_level="info"
     )
 